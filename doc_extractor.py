@@ -1,21 +1,32 @@
 import logging
 from google.cloud import documentai_v1beta3 as documentai
 from google.api_core.client_options import ClientOptions
-from google.cloud import storage
 import os
-import json
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from gcs_client import get_storage_client
+from jsonl_sink import JsonlSink
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-storage_client = storage.Client()
+storage_client = get_storage_client()
 
 
 def is_valid_file(filename):
     return filename.lower().endswith(".pdf")
 
+
+def input_stem(name):
+    """Stem shared by an input PDF and its Doc AI outputs, which are written as ``<stem>-<shard>.json``."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return stem.rsplit("-", 1)[0] if name.endswith(".json") else stem
+
 class DocAIExtractor:
     def __init__(self, project_id, location, processor_id, bucket_name, doc_input_prefix, doc_output_prefix, output_jsonl,
-                 batch_limit=20, field_mask="text,entities"):
+                 batch_limit=20, field_mask="entities", download_workers=16, max_concurrent_batches=5,
+                 resume=False):
         self.project_id = project_id
         self.location = location
         self.processor_id = processor_id
@@ -25,92 +36,141 @@ class DocAIExtractor:
         self.batch_limit = batch_limit
         self.field_mask = field_mask
         self.output_jsonl = output_jsonl
+        self.download_workers = download_workers
+        self.max_concurrent_batches = max_concurrent_batches
+        self.resume = resume
         self.docai_client = documentai.DocumentProcessorServiceClient(
             client_options=ClientOptions(api_endpoint=f"{self.location}-documentai.googleapis.com")
         )
         self.records = []
 
-    def submit_batch_docai_job(self):
-        all_blobs = list(storage_client.list_blobs(self.bucket_name, prefix=self.doc_input_prefix))
-        file_uris = [
+    def submit_batch_docai_job(self, skip_stems=frozenset()):
+        blobs = storage_client.list_blobs(
+            self.bucket_name, prefix=self.doc_input_prefix, fields="items(name),nextPageToken"
+        )
+        file_uris = (
             f"gs://{self.bucket_name}/{blob.name}"
-            for blob in all_blobs
-            if not blob.name.endswith("/") and is_valid_file(blob.name)
-        ]
+            for blob in blobs
+            if not blob.name.endswith("/") and is_valid_file(blob.name) and input_stem(blob.name) not in skip_stems
+        )
 
-        logging.info(f"Found {len(file_uris)} valid files for processing.")
         logging.info(f"Processing files in batches of {self.batch_limit}...")
 
-        for i in range(0, len(file_uris), self.batch_limit):
-            chunk = file_uris[i:i + self.batch_limit]
-
-            gcs_documents = [
-                documentai.GcsDocument(gcs_uri=uri, mime_type="application/pdf") for uri in chunk
-            ]
-
-            input_config = documentai.BatchDocumentsInputConfig(
-                gcs_documents=documentai.GcsDocuments(documents=gcs_documents)
-            )
-
-            gcs_output_config = documentai.DocumentOutputConfig.GcsOutputConfig(
-                gcs_uri=f"gs://{self.bucket_name}/{self.doc_output_prefix}",
-                field_mask=self.field_mask
-            )
-
-            output_config = documentai.DocumentOutputConfig(
-                gcs_output_config=gcs_output_config
-            )
+        batch_number = 0
+        total_files = 0
+        futures = []
+        # Bounds the number of long-running operations in flight at once to respect quota
+        in_flight = threading.Semaphore(self.max_concurrent_batches)
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_batches) as executor:
+            while chunk := list(islice(file_uris, self.batch_limit)):
+                batch_number += 1
+                total_files += len(chunk)
+
+                in_flight.acquire()
+                operation = self.docai_client.batch_process_documents(request=self._build_batch_request(chunk))
+                logging.info(f"Submitted batch {batch_number} as operation {operation.operation.name}.")
+                future = executor.submit(self._wait_for_batch, operation, batch_number)
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append(future)
+
+            for future in futures:
+                future.result()
+
+        logging.info(f"Processed {total_files} valid files in {batch_number} batches.")
+
+    def _build_batch_request(self, chunk):
+        gcs_documents = [
+            documentai.GcsDocument(gcs_uri=uri, mime_type="application/pdf") for uri in chunk
+        ]
 
-            processor_path = self.docai_client.processor_path(
-                self.project_id, self.location, self.processor_id
-            )
+        input_config = documentai.BatchDocumentsInputConfig(
+            gcs_documents=documentai.GcsDocuments(documents=gcs_documents)
+        )
 
-            request = documentai.BatchProcessRequest(
-                name=processor_path,
-                input_documents=input_config,
-                document_output_config=output_config
-            )
+        gcs_output_config = documentai.DocumentOutputConfig.GcsOutputConfig(
+            gcs_uri=f"gs://{self.bucket_name}/{self.doc_output_prefix}",
+            field_mask=self.field_mask
+        )
 
-            operation = self.docai_client.batch_process_documents(request=request)
-            logging.info(f"Waiting for batch operation {operation.operation.name} to complete...")
-            operation.result()
-            logging.info(f"Batch {i // self.batch_limit + 1} complete.")
+        output_config = documentai.DocumentOutputConfig(
+            gcs_output_config=gcs_output_config
+        )
 
+        processor_path = self.docai_client.processor_path(
+            self.project_id, self.location, self.processor_id
+        )
 
-    def parse_docai_results(self):
-        output_blobs = storage_client.list_blobs(self.bucket_name, prefix=self.doc_output_prefix)
+        return documentai.BatchProcessRequest(
+            name=processor_path,
+            input_documents=input_config,
+            document_output_config=output_config
+        )
 
-        for blob in output_blobs:
-            if not blob.name.endswith(".json"):
-                continue
+    def _wait_for_batch(self, operation, batch_number):
+        logging.info(f"Waiting for batch operation {operation.operation.name} to complete...")
+        operation.result()
+        logging.info(f"Batch {batch_number} complete.")
 
-            logging.info(f"Processing output: {blob.name}")
-            document = documentai.Document.from_json(blob.download_as_bytes(), ignore_unknown_fields=True)
-            entity_dict = {e.type_: e.mention_text.strip() for e in document.entities}
 
+    def _list_output_blobs(self):
+        blobs = storage_client.list_blobs(
+            self.bucket_name, prefix=self.doc_output_prefix, fields="items(name),nextPageToken"
+        )
+        return (blob for blob in blobs if blob.name.endswith(".json"))
+
+    def parse_docai_results(self, sink=None, processed_filenames=frozenset()):
+        """Pass each output's entities to ``sink`` (default: ``self.records.append``); returns the record count."""
+        sink = sink or self.records.append
+        # Outputs from earlier runs share file names with new ones, so keep only the first output per name
+        seen = set(processed_filenames)
+        json_blobs = []
+        for blob in self._list_output_blobs():
             filename = os.path.basename(blob.name)
-            entity_dict["file_name"] = filename
-
-            self.records.append(entity_dict)
-            logging.info(f"Extracted entities from {filename}: {entity_dict}")
-        return self.records
-
-    def export_to_jsonl(self):
-        with open(self.output_jsonl, 'w') as f:
-            for record in self.records:
-                json.dump(record, f)
-                f.write('\n')
-        print(f"\nJSONL saved to {self.output_jsonl}")
+            if filename not in seen:
+                seen.add(filename)
+                json_blobs.append(blob)
+
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            payloads = executor.map(lambda blob: blob.download_as_bytes(), json_blobs)
+            for blob, payload in zip(json_blobs, payloads):
+                logging.info(f"Processing output: {blob.name}")
+                # Only entities are needed, so skip building the full Document proto
+                document = orjson.loads(payload)
+                entity_dict = {
+                    e.get("type", ""): e.get("mentionText", "").strip() for e in document.get("entities", [])
+                }
+
+                filename = os.path.basename(blob.name)
+                entity_dict["file_name"] = filename
+
+                sink(entity_dict)
+                logging.info(f"Extracted entities from {filename}: {entity_dict}")
+        return len(json_blobs)
 
     def run(self):
-        logging.info("Starting Document AI batch processing...")
-        self.submit_batch_docai_job()
-        logging.info("Document AI batch processing completed.")
-        logging.info("Parsing Document AI results...")
-        results = self.parse_docai_results()
-        logging.info("Document AI results parsing completed.")
-        self.export_to_jsonl()
-        return results
+        """Process and parse all inputs, streaming records to ``output_jsonl``; returns the records parsed in this run."""
+        # With resume, inputs whose outputs are already in the JSONL are neither resubmitted nor re-parsed,
+        # and inputs that finished processing but were never parsed are only parsed
+        with JsonlSink(self.output_jsonl, resume=self.resume) as sink:
+            processed = set(sink.processed_filenames)
+            skip_stems = {input_stem(name) for name in processed}
+            if self.resume:
+                skip_stems.update(input_stem(blob.name) for blob in self._list_output_blobs())
+            if skip_stems:
+                logging.info(f"Resuming: skipping {len(skip_stems)} inputs that already have outputs.")
+            logging.info("Starting Document AI batch processing...")
+            self.submit_batch_docai_job(skip_stems=skip_stems)
+            logging.info("Document AI batch processing completed.")
+            logging.info("Parsing Document AI results...")
+
+            def emit(record):
+                sink(record)
+                self.records.append(record)
+
+            self.parse_docai_results(emit, processed_filenames=processed)
+            logging.info("Document AI results parsing completed.")
+        print(f"\nJSONL saved to {self.output_jsonl}")
+        return self.records
 
 if __name__ == "__main__":
     import argparse
@@ -123,8 +183,11 @@ if __name__ == "__main__":
     parser.add_argument("--doc_input_prefix", type=str, required=True, help="Input prefix for documents in GCS.")
     parser.add_argument("--doc_output_prefix", type=str, required=True, help="Output prefix for processed documents in GCS.")
     parser.add_argument("--batch_limit", type=int, default=20, help="Number of files to process in each batch (default: 20).")
-    parser.add_argument("--field_mask", type=str, default=None, help="Field mask for output documents.")
+    parser.add_argument("--max_concurrent_batches", type=int, default=5, help="Maximum batch operations running at once (default: 5).")
+    parser.add_argument("--field_mask", type=str, default="entities", help="Field mask for output documents (default: entities).")
+    parser.add_argument("--download_workers", type=int, default=16, help="Number of output JSON files downloaded concurrently (default: 16).")
     parser.add_argument("--output_jsonl", type=str, default="docai_output.jsonl", help="Output JSONL file path.")
+    parser.add_argument("--resume", action="store_true", help="Append to --output_jsonl and skip inputs whose outputs it already contains.")
 
     args = parser.parse_args()
 
@@ -137,7 +200,10 @@ if __name__ == "__main__":
         doc_output_prefix=args.doc_output_prefix,
         output_jsonl=args.output_jsonl,
         batch_limit=args.batch_limit,
-        field_mask=args.field_mask 
+        field_mask=args.field_mask,
+        download_workers=args.download_workers,
+        max_concurrent_batches=args.max_concurrent_batches,
+        resume=args.resume
     )
     
     extractor.run()
\ No newline at end of file
@@ -0,0 +1,24 @@
+import threading
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from requests.adapters import HTTPAdapter
+
+# Sized for the concurrent listing/download pools in both extractors
+POOL_SIZE = 64
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_storage_client() -> storage.Client:
+    """Return the process-wide storage client, backed by a session with a POOL_SIZE connection pool."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+            session = AuthorizedSession(credentials)
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            _client = storage.Client(project=project, credentials=credentials, _http=session)
+    return _client
@@ -1,15 +1,193 @@
 import os
 import re
+import asyncio
+import csv
 import json
 import time
+import hashlib
 import tempfile
-import pandas as pd
+import threading
+import multiprocessing
+import fitz
+import orjson
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Optional
-from PyPDF2 import PdfReader
-from google.cloud import storage
-from vertexai.generative_models import GenerativeModel
+from google.api_core import exceptions as gexc
+from google.cloud.storage import transfer_manager
+from gcs_client import get_storage_client
+from jsonl_sink import JsonlSink
+from vertexai.generative_models import GenerationConfig, GenerativeModel
 import random
 
+# PDFs with at least this many pages are split across worker processes
+LARGE_PDF_PAGES = 100
+PDF_PROCESS_WORKERS = min(os.cpu_count() or 1, 4)
+# GCS downloads run this many at once; blobs above LARGE_BLOB_BYTES are fetched in parallel slices
+DOWNLOAD_WORKERS = 8
+LARGE_BLOB_BYTES = 100 * 1024 * 1024
+# Bytes read from each end of a PDF to build its duplicate-detection key
+DEDUP_SAMPLE_BYTES = 64 * 1024
+# Rough Gemini token size used to turn token budgets into character offsets
+CHARS_PER_TOKEN = 4
+
+# Gemini errors worth retrying, and errors that will fail the same way every time.
+# TooManyRequests/GatewayTimeout are the REST (429/504) bases of gRPC's ResourceExhausted/DeadlineExceeded.
+RETRYABLE_ERRORS = (
+    gexc.TooManyRequests, gexc.ServiceUnavailable, gexc.GatewayTimeout, gexc.InternalServerError
+)
+TERMINAL_ERRORS = (gexc.InvalidArgument, gexc.PermissionDenied, gexc.NotFound, gexc.FailedPrecondition)
+
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE | re.MULTILINE)
+_LIST_SPLIT_RE = re.compile(r"[\n•*\-]+")
+
+_STRUCTURED_FIELDS = frozenset({
+    "ServicesProvided", "ReportsInScope", "ControlObjective",
+    "ControlExceptionIdentified", "ControlDescription", "CUECDescription"
+})
+
+_LIST_LIKE_FIELDS = frozenset({
+    "ThirdPartyServiceProvider", "ReportsOutOfScope",
+    "ControlNumber", "CUECNumber", "SubserviceProvider"
+})
+
+
+def _string_list_schema() -> dict:
+    return {"type": "ARRAY", "items": {"type": "STRING"}, "nullable": True}
+
+
+def _object_list_schema(*keys: str) -> dict:
+    return {
+        "type": "ARRAY",
+        "items": {"type": "OBJECT", "properties": {key: {"type": "STRING"} for key in keys}},
+        "nullable": True,
+    }
+
+
+# Response schema for each field when all fields are requested in a single call
+FIELD_SCHEMAS = {
+    "ThirdPartyServiceProvider": _string_list_schema(),
+    "SOC1ReportType": {"type": "STRING", "nullable": True},
+    "ServiceAuditor": {"type": "STRING", "nullable": True},
+    "AuditorOpinionDate": {"type": "STRING", "nullable": True},
+    "AuditorOpinionType": {"type": "STRING", "nullable": True},
+    "ReportPeriod": {"type": "STRING", "nullable": True},
+    "ServicesProvided": _object_list_schema("service", "description"),
+    "ReportsInScope": _object_list_schema("report_name", "source_page", "source_control"),
+    "ReportsOutOfScope": _string_list_schema(),
+    "ControlObjective": _object_list_schema("id", "objective"),
+    "ControlExceptionIdentified": _object_list_schema("control", "exception_found"),
+    "ControlNumber": _string_list_schema(),
+    "ControlDescription": _object_list_schema("number", "description"),
+    "CUECNumber": _string_list_schema(),
+    "CUECDescription": _object_list_schema("number", "description"),
+    "SubserviceProvider": _string_list_schema(),
+}
+
+
+def _is_error(value: object) -> bool:
+    return isinstance(value, str) and value.startswith("Error:")
+
+
+def _write_atomic(path: str, text: str):
+    """Write ``text`` via a temp file and rename so a crash never leaves a truncated cache entry."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _extract_page_range(filepath: str, start: int, stop: int) -> str:
+    """Extract text for pages [start, stop); runs in a worker process with its own document handle."""
+    with fitz.open(filepath) as doc:
+        return "\n".join(doc[i].get_text() for i in range(start, stop))
+
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    """Return the process pool shared by all large-PDF extractions, starting it on first use."""
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            # Spawn rather than fork: callers run inside worker threads
+            _page_pool = ProcessPoolExecutor(
+                max_workers=PDF_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+    return _page_pool
+
+
+async def _gather_bounded(limit: int, coros) -> list:
+    """``asyncio.gather`` that runs at most ``limit`` of ``coros`` at once."""
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+
+class RateLimiter:
+    """Thread-safe token bucket; each ``with`` / ``async with`` block consumes one token."""
+
+    def __init__(self, requests_per_minute: int):
+        self.capacity = max(1, requests_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _try_acquire(self) -> Optional[float]:
+        """Take a token and return None, or return the seconds until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while (wait := self._try_acquire()) is not None:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while (wait := self._try_acquire()) is not None:
+            await asyncio.sleep(wait)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Return the server-suggested retry delay from a quota error, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("Retry-After"):
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+    return None
+
 
 class GeminiExtractor:
     def __init__(
@@ -22,18 +200,58 @@ class GeminiExtractor:
         model_name: str = "gemini-2.5-pro",
         max_retries: int = 3,
         retry_delay: float = 3.0,
+        num_workers: int = min(os.cpu_count() or 1, 4),
+        field_workers: int = 4,
+        requests_per_minute: int = 60,
+        cache_dir: Optional[str] = None,
+        chunk_tokens: int = 8000,
+        chunk_overlap: int = 500,
+        chunk_workers: int = 4,
+        output_jsonl: Optional[str] = None,
+        use_async: bool = False,
+        resume: bool = False,
     ):
         self.pdf_dir = pdf_dir
         self.bucket_name = bucket_name
         self.gcs_prefix = gcs_prefix
         self.output_csv = output_csv
         self.output_json = output_json
+        self.output_jsonl = output_jsonl
+        self.use_async = use_async
+        self.resume = resume
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.num_workers = num_workers
+        self.field_workers = field_workers
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.chunk_workers = chunk_workers
+        self.model_name = model_name
         self.model = GenerativeModel(model_name)
+        self._limiter = RateLimiter(requests_per_minute)
         self.prompts = self._init_prompts()
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.batch_prompt = self._init_batch_prompt()
+        self.response_schema = {
+            "type": "OBJECT",
+            "properties": {field: FIELD_SCHEMAS[field] for field in self.prompts},
+            "required": list(self.prompts),
+        }
+        self.batch_config = GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=self.response_schema,
+        )
+        # Cached extractions are keyed on everything that shapes the model output.
+        self.prompt_version = hashlib.md5(json.dumps(
+            [self.model_name, self.prompts, self.batch_prompt, self.response_schema], sort_keys=True
+        ).encode()).hexdigest()[:8]
         self.records = []
-        self.storage_client = storage.Client() if bucket_name else None
+        self.dup_map = {}
+        self.processed_filenames = set()
+        self._records_lock = threading.Lock()
+        self.storage_client = get_storage_client() if bucket_name else None
 
     def _init_prompts(self) -> dict:
         return {
@@ -56,96 +274,401 @@ class GeminiExtractor:
         }
 
 
-    def _extract_pdf_text(self, filepath: str) -> str:
-        reader = PdfReader(filepath)
-        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    def _init_batch_prompt(self) -> str:
+        instructions = "\n".join(f"- {field}: {prompt}" for field, prompt in self.prompts.items())
+        return (
+            "Extract the following fields from the SOC report above and return them as a single JSON object "
+            "keyed by field name. Use null for any field that is not present.\n" + instructions
+        )
+
+    @staticmethod
+    def _file_hash(filepath: str) -> str:
+        digest = hashlib.blake2b()
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _cache_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def _extract_pdf_text(self, filepath: str, file_hash: Optional[str] = None) -> str:
+        """Return the PDF text, reading from / writing to the on-disk cache when enabled."""
+        cache_path = None
+        if self.cache_dir:
+            cache_path = self._cache_path(f"{file_hash or self._file_hash(filepath)}.txt")
+            if os.path.exists(cache_path):
+                with open(cache_path, encoding="utf-8") as f:
+                    return f.read()
+        text = self._read_pdf_text(filepath)
+        if cache_path:
+            _write_atomic(cache_path, text)
+        return text
+
+    def _read_pdf_text(self, filepath: str) -> str:
+        with fitz.open(filepath) as doc:
+            page_count = doc.page_count
+            if page_count < LARGE_PDF_PAGES or PDF_PROCESS_WORKERS < 2:
+                return "\n".join(doc[i].get_text() for i in range(page_count))
+
+        step = -(-page_count // PDF_PROCESS_WORKERS)
+        ranges = [(filepath, start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        return "\n".join(_get_page_pool().map(_extract_page_range, *zip(*ranges)))
 
     def _clean_response(self, text: str) -> str:
         """Strip markdown triple backticks and optional json/lang identifiers."""
-        cleaned = re.sub(r"```(?:json)?\s*", "", text.strip(), flags=re.IGNORECASE)
-        cleaned = re.sub(r"\s*```$", "", cleaned.strip())
-        return cleaned.strip()
+        return _FENCE_RE.sub("", text).strip()
 
     def _parse_clean_json_field(self, raw_text: str, field: str) -> Optional[object]:
         """Parse expected JSON fields or fallback to post-processed list or string."""
+        if _is_error(raw_text):
+            # Keep API failures as a single string so they are never mistaken for list items
+            return raw_text
         cleaned = self._clean_response(raw_text)
         if cleaned.lower() == "null":
             return None
 
-        structured_fields = {
-            "ServicesProvided", "ReportsInScope", "ControlObjective",
-            "ControlExceptionIdentified", "ControlDescription", "CUECDescription"
-        }
-
-        list_like_fields = {
-            "ThirdPartyServiceProvider", "ReportsOutOfScope",
-            "ControlNumber", "CUECNumber", "SubserviceProvider"
-        }
-
-        if field in structured_fields:
+        if field in _STRUCTURED_FIELDS:
             try:
                 return json.loads(cleaned)
             except json.JSONDecodeError as e:
                 print(f"Warning: Failed to parse field '{field}' as JSON: {e}")
                 return cleaned  # fallback as string
 
-        if field in list_like_fields:
+        if field in _LIST_LIKE_FIELDS:
             # Normalize newlines, asterisks, and bullets
-            items = re.split(r"[\n•\*\-]+", cleaned)
-            stripped = [item.strip(" \n\t") for item in items if item.strip()]
+            stripped = [item.strip(" \n\t") for item in _LIST_SPLIT_RE.split(cleaned) if item.strip()]
             return stripped if stripped else None
 
         return cleaned
 
-    def _extract_field(self, prompt: str, context: str) -> Optional[str]:
+    def _backoff_delay(self, attempt: int) -> float:
+        return self.retry_delay * (2 ** attempt) * (1 + random.uniform(0, 0.5))
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after ``error``, or None if the call should not be retried."""
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.max_retries - 1:
+            return None
+        # TooManyRequests (HTTP 429) is also the base class of gRPC's ResourceExhausted
+        delay = _retry_after_seconds(error) if isinstance(error, gexc.TooManyRequests) else None
+        return delay if delay is not None else self._backoff_delay(attempt)
+
+    @staticmethod
+    def _log_final_error(error: Exception):
+        if isinstance(error, TERMINAL_ERRORS):
+            print(f"Non-retryable {type(error).__name__}: {error}")
+        elif not isinstance(error, RETRYABLE_ERRORS):
+            print(f"Unexpected {type(error).__name__}, not retrying: {error}")
+        else:
+            print(f"Giving up after {type(error).__name__}: {error}")
+
+    async def _call_model(self, contents: list, generation_config: Optional[GenerationConfig]) -> str:
+        """One Gemini request, through the SDK's async API with ``use_async`` or as a blocking call on a worker thread."""
+        async with self._limiter:
+            if self.use_async:
+                response = await self.model.generate_content_async(contents, generation_config=generation_config)
+            else:
+                response = await asyncio.to_thread(
+                    self.model.generate_content, contents, generation_config=generation_config
+                )
+        return response.text.strip()
+
+    async def _generate(self, contents: list, generation_config: Optional[GenerationConfig] = None) -> Optional[str]:
         for attempt in range(self.max_retries):
             try:
-                response = self.model.generate_content([context, prompt])
-                return response.text.strip()
+                return await self._call_model(contents, generation_config)
             except Exception as e:
-                if attempt < self.max_retries - 1:
-                    delay = self.retry_delay * (2 ** attempt) + random.uniform(0, 1)
-                    print(f"Attempt {attempt + 1} failed: {e}. Retrying in {delay:.2f} seconds...")
-                    time.sleep(delay)
-                else:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self._log_final_error(e)
                     return f"Error: {str(e)}"
+                print(f"Attempt {attempt + 1} failed with {type(e).__name__}: {e}. Retrying in {delay:.2f} seconds...")
+                await asyncio.sleep(delay)
         return None
-    
-    def _get_pdf_files(self):
-        if self.pdf_dir:
-            for file in os.listdir(self.pdf_dir):
-                if file.endswith(".pdf"):
-                    yield os.path.join(self.pdf_dir, file)
-        elif self.bucket_name:
-            blobs = self.storage_client.list_blobs(self.bucket_name, prefix=self.gcs_prefix)
-            for blob in blobs:
-                if blob.name.endswith(".pdf"):
-                    original_name = os.path.basename(blob.name)
-                    tmp_path = os.path.join(tempfile.gettempdir(), original_name)
-                    blob.download_to_filename(tmp_path)
-                    yield tmp_path
-
-    def process_pdfs(self):
-        for filepath in self._get_pdf_files():
-            filename = os.path.basename(filepath)
-            print(f"\nProcessing: {filename}")
+
+    def _validate_batch(self, data: object) -> bool:
+        if not isinstance(data, dict) or set(self.prompts) - set(data):
+            return False
+        for field in self.prompts:
+            value = data[field]
+            expected = list if FIELD_SCHEMAS[field]["type"] == "ARRAY" else str
+            if value is not None and not isinstance(value, expected):
+                return False
+        return True
+
+    async def _extract_all_fields(self, context: str) -> Optional[dict]:
+        """Request every field in one structured-output call; None if the response fails validation."""
+        raw_output = await self._generate([context, self.batch_prompt], generation_config=self.batch_config)
+        return self._parse_batch_output(raw_output)
+
+    def _parse_batch_output(self, raw_output: Optional[str]) -> Optional[dict]:
+        if _is_error(raw_output):
+            # The call itself failed; per-field prompts would only repeat the failure 16 times
+            return {field: raw_output for field in self.prompts}
+        if raw_output is None:
+            return None
+        try:
+            data = json.loads(raw_output)
+        except json.JSONDecodeError:
+            return None
+        if not self._validate_batch(data):
+            return None
+        parsed = {}
+        for field in self.prompts:
+            value = data[field]
+            if value == [] or (isinstance(value, str) and value.strip().lower() in ("", "null")):
+                value = None
+            parsed[field] = value
+        return parsed
+
+    async def _extract_fields_individually(self, context: str, filename: str) -> dict:
+        async def extract(field: str):
+            raw_output = await self._generate([context, self.prompts[field]])
+            print(f" - Extracted: {field} ({filename})")
+            return self._parse_clean_json_field(raw_output, field)
+
+        fields = list(self.prompts)
+        return dict(zip(fields, await _gather_bounded(self.field_workers, (extract(field) for field in fields))))
+
+    def _blob_file_name(self, blob_name: str) -> str:
+        """Blob path relative to the folder of ``gcs_prefix``, so same-named PDFs in different folders stay distinct."""
+        prefix = self.gcs_prefix or ""
+        folder = prefix[:prefix.rfind("/") + 1]
+        return blob_name[len(folder):] if blob_name.startswith(folder) else blob_name
+
+    def _download_pdfs(self, download_dir: str) -> list:
+        """Download every PDF under the GCS prefix into ``download_dir`` concurrently.
+
+        Returns ``(local_path, file_name)`` pairs.
+        """
+        # crc32c is needed for the checksum check in download_chunks_concurrently
+        blobs = self.storage_client.list_blobs(
+            self.bucket_name, prefix=self.gcs_prefix, fields="items(name,size,crc32c),nextPageToken"
+        )
+        # Mirror the relative blob paths so PDFs sharing a basename in different folders don't overwrite each other
+        small, large = [], []
+        for blob in blobs:
+            filename = self._blob_file_name(blob.name)
+            if not blob.name.endswith(".pdf") or filename in self.processed_filenames:
+                continue
+            tmp_path = os.path.join(download_dir, filename)
+            os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+            (large if (blob.size or 0) > LARGE_BLOB_BYTES else small).append((blob, tmp_path))
+
+        files = []
+        results = transfer_manager.download_many(
+            small, max_workers=DOWNLOAD_WORKERS, worker_type=transfer_manager.THREAD
+        )
+        for (blob, tmp_path), result in zip(small, results):
+            if isinstance(result, Exception):
+                print(f"Failed to download {blob.name}: {result}")
+            else:
+                files.append((tmp_path, self._blob_file_name(blob.name)))
+        for blob, tmp_path in large:
             try:
-                full_text = self._extract_pdf_text(filepath)
+                transfer_manager.download_chunks_concurrently(
+                    blob, tmp_path, max_workers=DOWNLOAD_WORKERS, worker_type=transfer_manager.THREAD
+                )
+                files.append((tmp_path, self._blob_file_name(blob.name)))
             except Exception as e:
-                print(f"Failed to read {filename}: {e}")
+                print(f"Failed to download {blob.name}: {e}")
+        return files
+
+    @staticmethod
+    def _dedup_key(filepath: str) -> str:
+        """Cheap content key from the file size plus its first and last DEDUP_SAMPLE_BYTES."""
+        size = os.path.getsize(filepath)
+        digest = hashlib.blake2b(str(size).encode())
+        with open(filepath, "rb") as f:
+            digest.update(f.read(DEDUP_SAMPLE_BYTES))
+            if size > DEDUP_SAMPLE_BYTES:
+                f.seek(max(size - DEDUP_SAMPLE_BYTES, DEDUP_SAMPLE_BYTES))
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def _get_pdf_files(self, download_dir: str):
+        """Yield unique ``(filepath, file_name)`` pairs; later copies of the same content are recorded in ``dup_map``."""
+        seen = {}
+        for filepath, filename in self._list_pdf_files(download_dir):
+            key = self._dedup_key(filepath)
+            if key in seen:
+                print(f"Skipping {filename}: duplicate of {seen[key]}")
+                self.dup_map.setdefault(seen[key], []).append(filename)
                 continue
-            result = {"file_name": filename}
-            for field, prompt in self.prompts.items():
-                print(f" - Extracting: {field}")
-                raw_output = self._extract_field(prompt, full_text)
-                parsed_output = self._parse_clean_json_field(raw_output, field)
-                result[field] = parsed_output
-            self.records.append(result)
-        return self.records
+            seen[key] = filename
+            yield filepath, filename
+
+    def _list_pdf_files(self, download_dir: str):
+        if self.pdf_dir:
+            for file in os.listdir(self.pdf_dir):
+                if file.endswith(".pdf") and file not in self.processed_filenames:
+                    yield os.path.join(self.pdf_dir, file), file
+        elif self.bucket_name:
+            yield from self._download_pdfs(download_dir)
+
+    @staticmethod
+    def _has_errors(result: dict) -> bool:
+        return any(_is_error(value) for value in result.values())
+
+    def _chunk_text(self, text: str) -> list:
+        """Split text into overlapping windows of roughly ``chunk_tokens`` tokens."""
+        size = self.chunk_tokens * CHARS_PER_TOKEN
+        overlap = min(self.chunk_overlap, self.chunk_tokens // 2) * CHARS_PER_TOKEN
+        if len(text) <= size:
+            return [text]
+        step = size - overlap
+        return [text[start:start + size] for start in range(0, len(text) - overlap, step)]
+
+    def _chunk_cache_path(self, chunk: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        chunk_hash = hashlib.blake2b(chunk.encode("utf-8")).hexdigest()
+        return self._cache_path(f"chunk_{chunk_hash}_{self.prompt_version}.json")
+
+    @staticmethod
+    def _load_json_cache(cache_path: Optional[str]) -> Optional[dict]:
+        if not cache_path or not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: ignoring unreadable cache file {cache_path}")
+            return None
+
+    def _store_json_cache(self, cache_path: Optional[str], data: dict):
+        if cache_path and not self._has_errors(data):
+            _write_atomic(cache_path, json.dumps(data))
+
+    async def _extract_chunk(self, chunk: str, filename: str) -> dict:
+        cache_path = self._chunk_cache_path(chunk)
+        cached = self._load_json_cache(cache_path)
+        if cached is not None:
+            return cached
+        parsed = await self._extract_all_fields(chunk)
+        if parsed is None:
+            print(f" - Batched extraction failed for {filename}; falling back to per-field prompts")
+            parsed = await self._extract_fields_individually(chunk, filename)
+        self._store_json_cache(cache_path, parsed)
+        return parsed
+
+    def _merge_chunk_results(self, chunk_results: list) -> dict:
+        """Union and dedupe list fields across chunks; take the first non-null value for scalars.
+
+        A field that failed in any chunk keeps the error so the document is neither cached nor treated as done.
+        """
+        merged = {}
+        for field in self.prompts:
+            values = [result[field] for result in chunk_results if result.get(field) is not None]
+            errors = [value for value in values if _is_error(value)]
+            if errors:
+                merged[field] = errors[0]
+            elif not values:
+                merged[field] = None
+            elif FIELD_SCHEMAS[field]["type"] == "ARRAY":
+                items, seen = [], set()
+                for value in values:
+                    for item in value if isinstance(value, list) else [value]:
+                        key = json.dumps(item, sort_keys=True)
+                        if key not in seen:
+                            seen.add(key)
+                            items.append(item)
+                merged[field] = items
+            else:
+                merged[field] = values[0]
+        return merged
+
+    async def _extract_document(self, full_text: str, filename: str) -> dict:
+        chunks = self._chunk_text(full_text)
+        if len(chunks) == 1:
+            return await self._extract_chunk(chunks[0], filename)
+        print(f" - Split {filename} into {len(chunks)} chunks")
+        chunk_results = await _gather_bounded(
+            self.chunk_workers, (self._extract_chunk(chunk, filename) for chunk in chunks)
+        )
+        return self._merge_chunk_results(chunk_results)
+
+    def _load_pdf(self, filepath: str, filename: str):
+        """Return ``(cached_result, full_text, result_cache)``; a cached result means there is nothing to extract."""
+        print(f"\nProcessing: {filename}")
+        result_cache = None
+        file_hash = None
+        if self.cache_dir:
+            file_hash = self._file_hash(filepath)
+            result_cache = self._cache_path(f"{file_hash}_{self.prompt_version}.json")
+            cached = self._load_json_cache(result_cache)
+            if cached is not None:
+                print(f" - Using cached result for {filename}")
+                return {**cached, "file_name": filename}, None, None
+        try:
+            full_text = self._extract_pdf_text(filepath, file_hash)
+        except Exception as e:
+            print(f"Failed to read {filename}: {e}")
+            return None, None, None
+        return None, full_text, result_cache
+
+    def _finish_pdf(self, filename: str, parsed: dict, result_cache: Optional[str]) -> dict:
+        # Keep columns in prompt order regardless of completion order
+        result = {"file_name": filename, **{field: parsed[field] for field in self.prompts}}
+        self._store_json_cache(result_cache, result)
+        return result
+
+    async def _process_one_pdf(self, filepath: str, filename: str) -> Optional[dict]:
+        # Hashing and text extraction are blocking, so keep them off the event loop
+        cached, full_text, result_cache = await asyncio.to_thread(self._load_pdf, filepath, filename)
+        if full_text is None:
+            return cached
+        parsed = await self._extract_document(full_text, filename)
+        return self._finish_pdf(filename, parsed, result_cache)
+
+    def _emit(self, result: Optional[dict], sink) -> int:
+        if result is None:
+            return 0
+        duplicates = [
+            {**result, "file_name": dup} for dup in self.dup_map.get(result["file_name"], [])
+        ]
+        with self._records_lock:
+            for record in [result, *duplicates]:
+                sink(record)
+        return 1 + len(duplicates)
+
+    def process_pdfs(self, sink=None):
+        """Extract every PDF into ``self.records``, or pass each record to ``sink`` and return the record count instead."""
+        async def main():
+            if not self.use_async:
+                # Every in-flight Gemini call holds a worker thread, so size the pool for the full fan-out
+                max_calls = self.num_workers * self.chunk_workers * self.field_workers
+                asyncio.get_running_loop().set_default_executor(
+                    ThreadPoolExecutor(max_workers=max_calls + self.num_workers)
+                )
+            return await self.process_pdfs_async(sink)
+
+        return asyncio.run(main())
+
+    async def process_pdfs_async(self, sink=None):
+        """Coroutine form of ``process_pdfs`` for callers already running an event loop."""
+        emit = sink or self.records.append
+
+        async def process(filepath: str, filename: str) -> int:
+            return self._emit(await self._process_one_pdf(filepath, filename), emit)
+
+        with tempfile.TemporaryDirectory(prefix="soc_pdfs_") as download_dir:
+            files = await asyncio.to_thread(lambda: list(self._get_pdf_files(download_dir)))
+            emitted = sum(await _gather_bounded(
+                self.num_workers, (process(filepath, filename) for filepath, filename in files)
+            ))
+        return emitted if sink else self.records
 
     def export_to_csv(self):
-        df = pd.DataFrame(self.records)
-        df.to_csv(self.output_csv, index=False)
+        fieldnames = ["file_name"] + list(self.prompts.keys())
+        with open(self.output_csv, 'w', newline='', encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for record in self.records:
+                writer.writerow({
+                    key: orjson.dumps(value).decode() if isinstance(value, (list, dict)) else value
+                    for key, value in record.items()
+                })
         print(f"\nCSV saved to {self.output_csv}")
 
     def export_to_json(self):
@@ -154,6 +677,17 @@ class GeminiExtractor:
         print(f"\nJSON saved to {self.output_json}")
 
     def run(self):
+        if self.output_jsonl:
+            # Stream to JSONL; with resume, skip whatever a previous run finished without errors
+            with JsonlSink(
+                self.output_jsonl, resume=self.resume, is_complete=lambda record: not self._has_errors(record)
+            ) as sink:
+                self.processed_filenames = set(sink.processed_filenames)
+                if self.processed_filenames:
+                    print(f"Resuming: skipping {len(self.processed_filenames)} files already in {self.output_jsonl}")
+                emitted = self.process_pdfs(sink)
+            print(f"\nJSONL saved to {self.output_jsonl} ({emitted} new records)")
+            return
         self.process_pdfs()
         self.export_to_json()
         #self.export_to_csv()
@@ -167,9 +701,19 @@ if __name__ == "__main__":
     parser.add_argument("--pdf_dir", type=str, required=False, help="Directory containing PDF files.")
     parser.add_argument("--output_csv", type=str, required=True, help="Output CSV file path.")
     parser.add_argument("--output_json", type=str, default="gemini_output.json", help="Output JSON file path.")
+    parser.add_argument("--output_jsonl", type=str, default=None, help="Optional JSONL file path; records are written as each PDF finishes and the JSON export is not written.")
     parser.add_argument("--model_name", type=str, default="gemini-2.5-pro", help="Gemini model name.")
     parser.add_argument("--max_retries", type=int, default=5, help="Maximum retries for API calls.")
     parser.add_argument("--retry_delay", type=float, default=3.0, help="Delay between retries in seconds.")
+    parser.add_argument("--num_workers", type=int, default=min(os.cpu_count() or 1, 4), help="Number of PDFs processed concurrently.")
+    parser.add_argument("--field_workers", type=int, default=4, help="Number of fields extracted concurrently when a chunk falls back to per-field prompts.")
+    parser.add_argument("--requests_per_minute", type=int, default=60, help="Gemini request quota shared across all workers.")
+    parser.add_argument("--chunk_tokens", type=int, default=8000, help="Approximate tokens per chunk sent to Gemini for long PDFs.")
+    parser.add_argument("--chunk_overlap", type=int, default=500, help="Approximate tokens shared between consecutive chunks.")
+    parser.add_argument("--chunk_workers", type=int, default=4, help="Number of chunks of one long PDF extracted concurrently.")
+    parser.add_argument("--use_async", action="store_true", help="Use the Gemini SDK's async API instead of blocking calls on worker threads.")
+    parser.add_argument("--resume", action="store_true", help="Append to --output_jsonl and skip files it already contains without errors.")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Directory for cached PDF text and results; enables incremental re-runs.")
 
     args = parser.parse_args()
 
@@ -179,9 +723,19 @@ if __name__ == "__main__":
         pdf_dir=args.pdf_dir,
         output_csv=args.output_csv,
         output_json=args.output_json,
+        output_jsonl=args.output_jsonl,
         model_name=args.model_name,
         max_retries=args.max_retries,
-        retry_delay=args.retry_delay
+        retry_delay=args.retry_delay,
+        num_workers=args.num_workers,
+        field_workers=args.field_workers,
+        requests_per_minute=args.requests_per_minute,
+        cache_dir=args.cache_dir,
+        chunk_tokens=args.chunk_tokens,
+        chunk_overlap=args.chunk_overlap,
+        chunk_workers=args.chunk_workers,
+        use_async=args.use_async,
+        resume=args.resume
     )
     
     extractor.run()
\ No newline at end of file
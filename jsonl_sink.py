@@ -0,0 +1,59 @@
+import os
+import threading
+import orjson
+
+
+class JsonlSink:
+    """Thread-safe JSONL writer; with ``resume`` it appends and ``processed_filenames`` lets a re-run skip finished files.
+
+    Records failing ``is_complete`` and any partial line left by a crash are dropped on open so they are redone.
+    """
+
+    def __init__(self, path: str, resume: bool = False, is_complete=None):
+        self.path = path
+        self.is_complete = is_complete or (lambda record: True)
+        self.processed_filenames = self._load_processed_filenames() if resume else set()
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab' if resume else 'wb', buffering=1 << 20)
+
+    def _load_processed_filenames(self) -> set:
+        processed = set()
+        if not os.path.exists(self.path):
+            return processed
+        kept, dropped = [], False
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = orjson.loads(line)
+                    filename = record["file_name"]
+                except (orjson.JSONDecodeError, KeyError, TypeError):
+                    dropped = True
+                    continue
+                if not line.endswith(b"\n") or not self.is_complete(record):
+                    dropped = True
+                    continue
+                processed.add(filename)
+                kept.append(line)
+        if dropped:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.writelines(kept)
+            os.replace(tmp_path, self.path)
+        return processed
+
+    def __call__(self, record: dict):
+        with self._lock:
+            self._file.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+            self._file.flush()
+            if self.is_complete(record):
+                self.processed_filenames.add(record.get("file_name"))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False